@@ -1,23 +1,31 @@
 import os
-# Disable parallelism for Hugging Face tokenizers to avoid fork-related warnings
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
-
 import sys
 import argparse
 import logging
 import socket
 import csv
-import json
 import time
+import hashlib
+import functools
+import importlib.util
+import itertools
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image
+import numpy as np
 import re
 import pytesseract
 from io import BytesIO
 from tqdm import tqdm  # Import tqdm for progress bar
 from datetime import datetime  # Import datetime at the top of the script
-import base64  # Import for Base64 encoding
-from tenacity import retry, stop_after_attempt, wait_fixed
+import pybase64  # SIMD Base64 encoding for image payloads
+import orjson  # Fast JSON for Ollama payloads and the alt text cache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 
 # Disable Hugging Face parallelism warnings & suppress excessive logs
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -29,11 +37,39 @@ parser = argparse.ArgumentParser(description="Generate alt text for images based
 parser.add_argument("-c", "--csv", help="Path to the input CSV file.")
 parser.add_argument("-m", "--model", default="blip", choices=["blip", "anthropic", "ollama", "azure_openai"],
                     help="Model to use for text generation.")
-parser.add_argument("-v", "--verbose", action="store_true", help="Enable detailed logging.")
+parser.add_argument("-v", "--verbose", action="count", default=0,
+                    help="Show progress messages (-v) or full debug output (-vv).")
+parser.add_argument("-b", "--batch-size", type=int, default=8,
+                    help="Number of images to caption per BLIP forward pass (default: 8).")
+parser.add_argument("--compile", action="store_true",
+                    help="Compile the BLIP vision encoder with torch.compile (slower start, faster batches).")
+parser.add_argument("--torch-threads", type=int, default=None,
+                    help="Number of CPU threads PyTorch uses for BLIP inference "
+                         "(default: half the CPU cores when running on CPU).")
+parser.add_argument("-w", "--workers", type=int, default=16,
+                    help="Number of threads downloading and screening images in the background (default: 16).")
+parser.add_argument("--api-workers", type=int, default=4,
+                    help="Number of concurrent requests to the Anthropic, Ollama or Azure OpenAI model (default: 4).")
+parser.add_argument("--rpm", type=float, default=0,
+                    help="Maximum requests per minute sent to the Anthropic, Ollama or Azure OpenAI model "
+                         "across all API workers (default: no limit).")
+parser.add_argument("--chunk-size", type=int, default=256,
+                    help="Number of CSV rows read, processed and written at a time (default: 256).")
+parser.add_argument("--cache-file", default=".alt_cache.jsonl",
+                    help="JSON Lines file used to reuse generated alt text across runs (default: .alt_cache.jsonl).")
+parser.add_argument("--no-cache", action="store_true", help="Do not read or write the alt text cache.")
+parser.add_argument("-q", "--quantize", default="none", choices=["none", "int8", "auto"],
+                    help="Load BLIP with int8 weights (bitsandbytes on GPU, dynamic quantization on CPU); "
+                         "'auto' uses half precision on GPU and int8 on CPU.")
+parser.add_argument("--ocr-engine", default="tesseract", choices=["tesseract", "tesserocr", "rapidocr"],
+                    help="OCR engine used to detect text-heavy images: the Tesseract CLI, libtesseract "
+                         "in-process via tesserocr, or RapidOCR on ONNX Runtime (default: tesseract).")
 args = parser.parse_args()
 
 # ✅ Configure logging based on verbosity
-logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# Per-row messages are logged at INFO/DEBUG, so the default WARNING level keeps large runs quiet
+log_level = logging.WARNING if not args.verbose else logging.INFO if args.verbose == 1 else logging.DEBUG
+logging.basicConfig(level=log_level, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # ✅ Show help and exit early if no CSV is provided
 if "-h" in sys.argv or "--help" in sys.argv or not args.csv:
@@ -44,23 +80,130 @@ if "-h" in sys.argv or "--help" in sys.argv or not args.csv:
 print(f"\n🔵 Running Alt Text Generator\n   - Model: {args.model}\n   - CSV File: {args.csv}\n")
 
 # ✅ Initialize model only when needed
-processor = None
-model = None
-DEFAULT_MODEL = "blip"
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+# Greedy decoding with a hard cap on new tokens: alt text is one short caption, so beam search
+# or sampling only multiplies decoder work. Blocking repeated trigrams stops greedy captions
+# from looping ("a man in a suit and a man in a suit ...") until they hit the cap
+BLIP_GENERATE_KWARGS = {"max_new_tokens": 40, "num_beams": 1, "do_sample": False, "no_repeat_ngram_size": 3}
+# BLIP's processor resizes every image to this square resolution
+BLIP_IMAGE_SIZE = 384
+# Longest side of images uploaded to vision APIs; larger images are re-encoded as JPEG first
+API_IMAGE_MAX_SIDE = 768
+API_IMAGE_JPEG_QUALITY = 85
+# Longest side Tesseract works on; large enough to keep body text legible
+OCR_IMAGE_MAX_SIDE = 1600
+# Images smaller than this many pixels (e.g. 200 x 200) are icons or thumbnails, too small to
+# hold the 20+ words that make an image count as text-heavy
+OCR_MIN_PIXELS = 40000
+# Cheap prefilter run before OCR: number of horizontally neighbouring pixels (on the grayscale
+# copy OCR reads) that differ by a sharp step. 20 words of small body text produce about 2,000
+# such steps, while photos mostly change gradually. A count rather than a share of the image,
+# so a short caption on a large plain screenshot still passes
+OCR_GATE_STEP = 64
+OCR_GATE_MIN_EDGES = 600
+# LSTM engine only, one uniform block of text: skips Tesseract's slower page layout analysis
+OCR_TESSERACT_CONFIG = "--oem 1 --psm 6"
 client = None
+ANTHROPIC_CLIENT = None
+# Attempts the Anthropic and OpenAI SDKs make on 408/409/429/5xx and connection errors. They back
+# off exponentially with jitter and honour the Retry-After header on rate limits
+API_MAX_RETRIES = 5
 
-if args.model == "blip":
+
+@functools.lru_cache(maxsize=1)
+def get_blip():
+    """
+    Load the BLIP processor and model once per process, on first use.
+
+    Uses the GPU in half precision when available and honours the --quantize,
+    --compile and --torch-threads options.
+
+    Returns:
+        tuple: (processor, model, device, dtype) where dtype is the type pixel
+        values must be cast to before calling the model.
+    """
     print("🔹 Initializing BLIP model...")
     logging.info("Initializing the BLIP model...")
+    import torch
     from transformers import BlipProcessor, BlipForConditionalGeneration
-    processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-    model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+    # The script only runs inference, so autograd bookkeeping is never needed
+    torch.set_grad_enabled(False)
+    # Each BLIP forward is already spread across cores by PyTorch's intra-op pool; cap it so it
+    # does not oversubscribe the CPU alongside the image download and OCR threads
+    torch_threads = args.torch_threads
+    if torch_threads is None and not torch.cuda.is_available():
+        torch_threads = max(1, (os.cpu_count() or 2) // 2)
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    # Use the GPU in half precision when available (bf16 on Ampere or newer), otherwise CPU fp32
+    if torch.cuda.is_available():
+        device = "cuda"
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    else:
+        device = "cpu"
+        dtype = torch.float32
+    logging.info(f"BLIP will run on {device} with {dtype}.")
+    from PIL import features
+    if not features.check_feature("libjpeg_turbo"):
+        logging.info("Pillow is not built with libjpeg-turbo; see alt-text-generator.py.md for faster image decoding.")
+
+    # int8 saves memory bandwidth on CPU, but on a GPU bitsandbytes int8 is slower than fp16 at the
+    # small batch sizes used here, so 'auto' only quantizes CPU runs
+    quantize = args.quantize
+    if quantize == "auto":
+        quantize = "int8" if device == "cpu" else "none"
+    elif quantize == "int8" and device == "cuda" and args.batch_size < 32:
+        logging.warning("⚠️ int8 BLIP on a GPU is usually slower than fp16 at small batch sizes; "
+                        "it mainly saves memory. Consider --quantize auto.")
+
+    if quantize == "int8" and device == "cuda":
+        # Loading 8-bit weights onto the GPU needs accelerate (for device_map) as well as bitsandbytes
+        missing = [name for name in ("bitsandbytes", "accelerate") if importlib.util.find_spec(name) is None]
+        if missing:
+            logging.error(f"❌ int8 BLIP on a GPU needs `pip install bitsandbytes accelerate` "
+                          f"(missing: {', '.join(missing)}); loading BLIP in {dtype} instead.")
+            quantize = "none"
+
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+    if quantize == "int8" and device == "cuda":
+        # 8-bit weights via bitsandbytes; the model is placed on the GPU while loading
+        from transformers import BitsAndBytesConfig
+        model = BlipForConditionalGeneration.from_pretrained(
+            BLIP_MODEL_NAME,
+            torch_dtype=dtype,
+            quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+            device_map={"": 0},
+        )
+    else:
+        model = BlipForConditionalGeneration.from_pretrained(
+            BLIP_MODEL_NAME, torch_dtype=dtype
+        ).to(device)
+        if quantize == "int8":
+            # Dynamic int8 quantization of the Linear layers for CPU inference
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    if args.compile:
+        # The vision encoder always sees batch x 3 x 384 x 384 inputs, so it compiles (and on CUDA
+        # captures graphs) once; the text decoder's growing sequence length is left eager
+        model.vision_model = torch.compile(
+            model.vision_model, mode="reduce-overhead" if device == "cuda" else "default"
+        )
+        logging.info("BLIP vision encoder compiled with torch.compile.")
+
+    return processor, model, device, dtype
+
+
+if args.model == "blip":
+    print("🔹 Using BLIP model (weights are loaded before the first batch)...")
 
 elif args.model == "anthropic":
     print("🔹 Using Anthropic Claude API...")
     import anthropic
     # export ANTHROPIC_API_KEY="your_api_key_here"
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+    # One client (and connection pool) shared by every request and worker thread in the run
+    if ANTHROPIC_API_KEY:
+        ANTHROPIC_CLIENT = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=API_MAX_RETRIES)
 
 elif args.model == "ollama":
     print("🔹 Using Ollama model...")
@@ -70,6 +213,7 @@ elif args.model == "azure_openai":
     print("🔹 Using Azure OpenAI API...")
     from openai import AzureOpenAI
     from openai import OpenAIError
+    from openai import BadRequestError
     # export AZURE_OPENAI_API_KEY="your_api_key_here"
     AZURE_OPENAI_ENDPOINT = "https://civicactions-openai.openai.azure.com/"
     DEPLOYMENT_NAME = "gpt-4o"
@@ -83,6 +227,7 @@ elif args.model == "azure_openai":
             api_key=subscription_key,
             azure_endpoint=AZURE_OPENAI_ENDPOINT,  # Correct base URL
             api_version=API_VERSION,
+            max_retries=API_MAX_RETRIES,
         )
         logging.info("✅ Azure OpenAI client initialized successfully.")
     except Exception as e:
@@ -108,8 +253,56 @@ PROBLEMATIC_SUGGESTIONS = [
     "Consider simplifying the text.",
     "Alt text is too short. Provide more context."
 ]
-# Enable logging with timestamps
-logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+# The Suggestions column joins several messages with "; ", so match any of them as a substring in one pass
+_PROBLEMATIC_RE = re.compile("|".join(map(re.escape, PROBLEMATIC_SUGGESTIONS)))
+
+# Columns this script adds to the input CSV
+OUTPUT_FIELDNAMES = ["Generated Alt Text"]
+
+# Static prompt text shared by every row; only the image details are filled in per call
+IMAGE_URL_PROMPT = "Generate concise and descriptive alt text for the following image URL: {image_url}."
+ANTHROPIC_PROMPT_PREFIX = (
+    "\n\nHuman: Generate alt text for an image. Respond ONLY with the text that should go inside "
+    "the alt attribute of an img tag. Do not include 'Alt text:', explanations, quotes, or any other text. "
+)
+ANTHROPIC_PROMPT_SUFFIX = "\n\nAssistant: I'll provide just the alt text with no additional text:\n"
+# Preambles Claude sometimes puts before the alt text, stripped (even when repeated) in one match
+ANTHROPIC_RESPONSE_PREFIXES = [
+    "Alt text:",
+    "Here is a concise and descriptive alt text for the image:",
+    "Here is a concise and descriptive alt text for the provided image:",
+    "I'll provide just the alt text with no additional text:",
+]
+_ANTHROPIC_PREFIX_RE = re.compile(
+    r"^(?:(?:" + "|".join(map(re.escape, ANTHROPIC_RESPONSE_PREFIXES)) + r")\s*)+", re.IGNORECASE
+)
+OLLAMA_PROMPT_PREFIX = (
+    "\n\nHuman: Generate alt text for an image. Respond ONLY with the text that should go inside "
+    "the alt attribute of an img tag. Keep it concise, factual, and limited to 350 characters. "
+)
+OLLAMA_PROMPT_SUFFIX = "\n\nAssistant:"
+
+# Shared HTTP session so image downloads reuse keep-alive connections across rows and threads
+SESSION = requests.Session()
+SESSION.headers.update({"Accept-Encoding": "gzip", "User-Agent": "alt-text-bot"})
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=Retry(total=3, backoff_factor=0.3))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+if args.model == "ollama":
+    # send_request_with_retry is the only retry layer for Ollama; urllib3 retrying connection
+    # errors underneath it as well would multiply the attempts when Ollama is down
+    SESSION.mount(OLLAMA_API_URL, HTTPAdapter(max_retries=0))
+
+# (connect, read) timeouts: image hosts should answer quickly; a local Ollama model may take
+# a while to produce its first token, but failing to connect at all should surface fast
+IMAGE_TIMEOUT = (3, 10)
+OLLAMA_TIMEOUT = (5, 90)
+
+# A successful connectivity probe is trusted for this many seconds, so worker threads do not
+# each open a socket to 8.8.8.8 for every image
+INTERNET_CHECK_INTERVAL = 30
+_last_internet_ok = 0.0
+
 
 def check_internet(host="8.8.8.8", port=53, timeout=3):
     """
@@ -117,89 +310,205 @@ def check_internet(host="8.8.8.8", port=53, timeout=3):
     Attempts to connect to a well-known public DNS server (Google's 8.8.8.8).
     Returns True if the connection is successful, otherwise False.
     """
+    global _last_internet_ok
+    if time.monotonic() - _last_internet_ok < INTERNET_CHECK_INTERVAL:
+        return True
     try:
-        socket.setdefaulttimeout(timeout)
-        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
+        with socket.create_connection((host, port), timeout=timeout):
+            pass
+        _last_internet_ok = time.monotonic()
         return True
-    except socket.error:
+    except OSError:
         return False
 
-def generate_with_blip(image_path_or_url, alt_text="", title_text=""):
+
+def shrink_image(image, min_side):
     """
-    Generate alt text using the BLIP model with a base64-encoded image.
-    
+    Decode an opened image to RGB at no more resolution than a model needs,
+    flattening any transparency onto white.
+
+    JPEGs are decoded at a reduced scale by libjpeg (draft mode), then the image is
+    box-reduced by a whole factor while its shorter side stays at least `min_side`
+    pixels, so the model's own resize never has to upsample.
+
+    Args:
+        image (PIL.Image): An image returned by Image.open, not yet loaded.
+        min_side (int): Smallest size the shorter side may be reduced to.
+
+    Returns:
+        PIL.Image: The decoded RGB image.
+    """
+    image.draft("RGB", (min_side, min_side))
+    # Transparent logos would otherwise reach the model as solid black
+    image = flatten_transparency(image)
+    # Drafted JPEGs already decode to RGB; only other modes need a converted copy
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    else:
+        image.load()
+    factor = min(image.size) // min_side
+    if factor > 1:
+        image = image.reduce(factor)
+    return image
+
+
+def flatten_transparency(image):
+    """Paste an image with an alpha channel or transparent colour onto white; others are returned as is."""
+    if "A" in image.getbands() or "transparency" in image.info:
+        # Transparent pixels are usually stored as black; dropping the alpha channel would
+        # turn dark text or logos on a transparent background into a solid black image
+        image = image.convert("RGBA")
+        image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image)
+    return image
+
+
+def shrink_image_bytes(image_data, max_side):
+    """
+    Downsize an encoded image for upload so its longest side is at most `max_side`.
+
+    Images already small enough are returned untouched; larger ones are decoded
+    at a reduced scale and re-encoded as JPEG.
+
+    Returns:
+        tuple: (bytes, MIME type) where the MIME type is None if the bytes are unchanged.
+    """
+    try:
+        image = Image.open(BytesIO(image_data))
+        if max(image.size) <= max_side:
+            return image_data, None
+        image.draft("RGB", (max_side, max_side))
+        image = flatten_transparency(image).convert("RGB")
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+        buffered = BytesIO()
+        image.save(buffered, format="JPEG", quality=API_IMAGE_JPEG_QUALITY)
+        return buffered.getvalue(), "image/jpeg"
+    except Exception as e:
+        logging.debug("Could not downsize image, sending it as is: %s", e)
+        return image_data, None
+
+
+# Leading bytes of the image formats vision APIs accept, checked in sniff_mime_type
+IMAGE_SIGNATURES = [
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+]
+
+
+def sniff_mime_type(image_data):
+    """Identify an image's MIME type from its bytes, so mislabelled URL suffixes do not matter."""
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if image_data.startswith(signature):
+            return mime_type
+    return "image/jpeg"
+
+
+def fetch_bytes(image_path_or_url):
+    """
+    Read the raw bytes of an image from a URL or a local file, once.
+
     Args:
         image_path_or_url (str): Path to a local image file or URL of the image.
-        alt_text (str): Existing alt text, if any, to provide context to the LLM.
-        title_text (str): Existing title text, if any, to provide context to the LLM.
 
     Returns:
-        str: Generated alt text.
+        bytes: The undecoded image data.
+
+    Raises:
+        requests.exceptions.RequestException: If the image cannot be downloaded.
+        OSError: If the local file cannot be read.
+    """
+    if image_path_or_url.startswith("http"):
+        response = SESSION.get(image_path_or_url, timeout=IMAGE_TIMEOUT)
+        response.raise_for_status()
+        data = response.content
+    else:
+        with open(image_path_or_url, "rb") as image_file:
+            data = image_file.read()
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Read %d bytes (sha256 %s) from %s",
+                      len(data), hashlib.sha256(data).hexdigest(), image_path_or_url)
+    return data
+
+
+def decode_blip_image(data):
+    """
+    Decode raw image bytes for BLIP captioning.
+
+    Args:
+        data (bytes): The undecoded image, as returned by fetch_bytes.
+
+    Returns:
+        tuple: (PIL.Image, None) on success, or (None, error message) on failure.
     """
     try:
-        # Load the image
-        if image_path_or_url.startswith("http"):
-            # Fetch the image from URL
-            response = requests.get(image_path_or_url, stream=True)
-            response.raise_for_status()
-            image = Image.open(response.raw).convert("RGB")
-            logging.info(f"Image fetched successfully from URL: {image_path_or_url}")
-        else:
-            # Load the image from a local file
-            image = Image.open(image_path_or_url).convert("RGB")
-            logging.info(f"Image loaded successfully from local file: {image_path_or_url}")
+        return shrink_image(Image.open(BytesIO(data)), BLIP_IMAGE_SIZE), None
+    except OSError as e:
+        logging.error(f"Error loading image file: {e}")
+        return None, "Error loading image file"
+    except Exception as e:
+        logging.error(f"Unexpected error loading image for BLIP: {e}")
+        return None, "\nError generating alt text with BLIP"
 
-        # Encode the image to Base64 for logging/debugging purposes
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        base64_image = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        logging.debug(f"Base64-encoded image size: {len(base64_image)} characters")
 
+def generate_with_blip_batch(images):
+    """
+    Generate alt text for several images with a single BLIP forward pass.
+
+    Args:
+        images (list): RGB PIL images to caption.
+
+    Returns:
+        list: Cleaned alt text for each image, in the same order as `images`.
+    """
+    if not images:
+        return []
+
+    import torch
+    processor, model, device, dtype = get_blip()
+    try:
         # Prepare context for BLIP
         # context = f"Provided alt text: {alt_text}. Title text: {title_text}."
         context = ""
 
-        # Generate alt text using BLIP
-        inputs = processor(image, text=context, return_tensors="pt")
-        outputs = model.generate(**inputs)
-        generated_text = processor.decode(outputs[0], skip_special_tokens=True)
+        # Generate alt text for the whole batch using BLIP
+        inputs = processor(images=images, text=[context] * len(images), return_tensors="pt", padding=True)
+        # Move inputs next to the model; only the pixel values take the model's dtype
+        inputs = {
+            key: value.to(device, dtype) if value.is_floating_point() else value.to(device)
+            for key, value in inputs.items()
+        }
+        with torch.inference_mode():
+            outputs = model.generate(**inputs, **BLIP_GENERATE_KWARGS)
+        generated_texts = processor.batch_decode(outputs, skip_special_tokens=True)
 
         # Post-process the generated text
-        cleaned_text = clean_and_post_process_alt_text(generated_text)
-        logging.info(f"\n\nBLIP generated alt text successfully:\n\n{cleaned_text}\n\n")
-        return cleaned_text
+        cleaned_texts = [clean_and_post_process_alt_text(text) for text in generated_texts]
+        logging.info("BLIP generated alt text for a batch of %d images.", len(images))
+        return cleaned_texts
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching image from URL: {e}")
-        return "Error fetching image from URL"
-    except OSError as e:
-        logging.error(f"Error loading image file: {e}")
-        return "Error loading image file"
     except Exception as e:
         logging.error(f"Unexpected error in BLIP generation: {e}")
-        return "\nError generating alt text with BLIP"
+        return ["\nError generating alt text with BLIP"] * len(images)
 
 
 def generate_with_anthropic(prompt):
     """Generate text using Anthropic's Claude API."""
     try:
-        # Initialize the Anthropic client
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        if not client.api_key:
+        # Reuse the Anthropic client created at startup
+        client = ANTHROPIC_CLIENT
+        if client is None or not client.api_key:
             raise ValueError("Anthropic API Key is not set. Please set the ANTHROPIC_API_KEY environment variable.")
         
         # Format the message with very specific instructions
         # formatted_prompt = f"\n\nHuman: {prompt}\n\nAssistant:"
-        formatted_prompt = (
-            "\n\nHuman: Generate alt text for an image. Respond ONLY with the text that should go inside "
-            "the alt attribute of an img tag. Do not include 'Alt text:', explanations, quotes, or any other text. "
-            f"Image details: {prompt}"
-            "\n\nAssistant: I'll provide just the alt text with no additional text:\n"
-        )
+        formatted_prompt = f"{ANTHROPIC_PROMPT_PREFIX}Image details: {prompt}{ANTHROPIC_PROMPT_SUFFIX}"
         
         print(f"INFO: Sending the following prompt to the LLM (Claude):\n{formatted_prompt}\n")
 
         try:
+            API_RATE_LIMITER.wait()
             response = client.messages.create(
                 model="claude-3-opus-20240229",
                 max_tokens=300,
@@ -215,16 +524,7 @@ def generate_with_anthropic(prompt):
             generated_text = response.content[0].text.strip()
             
             # Remove common prefixes and suffixes
-            prefixes_to_remove = [
-                "Alt text:", 
-                "Here is a concise and descriptive alt text for the image:",
-                "Here is a concise and descriptive alt text for the provided image:",
-                "I'll provide just the alt text with no additional text:",
-            ]
-            
-            for prefix in prefixes_to_remove:
-                if generated_text.startswith(prefix):
-                    generated_text = generated_text[len(prefix):].strip()
+            generated_text = _ANTHROPIC_PREFIX_RE.sub("", generated_text, count=1)
             
             # Remove any quotes
             generated_text = generated_text.strip('"\'')
@@ -248,36 +548,41 @@ def generate_with_anthropic(prompt):
         return f"Error generating text with Anthropic API: {str(e)}"
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(10))  # Retry logic with up to 3 attempts
-def send_request_with_retry(payload, timeout=60):
+def is_transient_error(error):
+    """Retry timeouts, dropped connections and 5xx gateway/server errors, but not other 4xx/5xx responses."""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    return (isinstance(error, requests.exceptions.HTTPError) and error.response is not None
+            and error.response.status_code in (500, 502, 503, 504))
+
+
+# Up to 5 attempts with jittered exponential backoff (at most 8 seconds between attempts)
+@retry(stop=stop_after_attempt(5), wait=wait_random_exponential(multiplier=0.5, max=8),
+       retry=retry_if_exception(is_transient_error), reraise=True)
+def send_request_with_retry(payload, timeout=OLLAMA_TIMEOUT, stream=False):
     """
     Send a request to the Ollama API with retry logic.
+
+    With stream=True the body is left unread so the caller can consume it as it arrives.
+    Every attempt, retries included, waits its turn under --rpm.
     """
-    response = requests.post(OLLAMA_API_URL, json=payload, timeout=timeout)
+    API_RATE_LIMITER.wait()
+    response = SESSION.post(OLLAMA_API_URL, data=orjson.dumps(payload), headers={"Content-Type": "application/json"},
+                            timeout=timeout, stream=stream)
     response.raise_for_status()
     return response
 
 
-def generate_with_ollama(image_path_or_url, prompt, model_name="llama3.2-vision:latest"):
+def generate_with_ollama(image_path_or_url, prompt, model_name="llama3.2-vision:latest", image_data=None):
     """Generate text using a hosted Ollama model with enhanced streaming response handling."""
     try:
         logging.info(f"Starting Ollama text generation - Model: {model_name} ...")
         
-        # Determine if input is a URL or local file
-        if image_path_or_url.startswith("http"):
-            logging.debug(f"Fetching image from URL: {image_path_or_url} ...")
-            response = requests.get(image_path_or_url, stream=True)
-            response.raise_for_status()
-            image_data = response.content
-            logging.info("Image fetched successfully.")
-        else:
-            # logging.debug("Reading image from local file...")
-            with open(image_path_or_url, "rb") as image_file:
-                image_data = image_file.read()
-            # logging.info("Image read successfully.")
-
-        # Encode image to Base64
-        base64_image = base64.b64encode(image_data).decode("utf-8")
+        # Fetch the image (unless it was downloaded while screening) and encode it to Base64
+        if image_data is None:
+            image_data = fetch_bytes(image_path_or_url)
+        image_data, _ = shrink_image_bytes(image_data, API_IMAGE_MAX_SIDE)
+        base64_image = pybase64.b64encode(image_data).decode("ascii")
         # logging.info("Image successfully encoded to Base64.")
 
         # Prepare payload
@@ -289,11 +594,7 @@ def generate_with_ollama(image_path_or_url, prompt, model_name="llama3.2-vision:
         #    "those priority. Large text should come first. \n\n"
         #    f"Image details: {prompt}"
         # )
-        formatted_prompt = (
-            "\n\nHuman: Generate alt text for an image. Respond ONLY with the text that should go inside "
-            "the alt attribute of an img tag. Keep it concise, factual, and limited to 350 characters. "
-            f"Image details: {prompt}\n\nAssistant:"
-        )
+        formatted_prompt = f"{OLLAMA_PROMPT_PREFIX}Image details: {prompt}{OLLAMA_PROMPT_SUFFIX}"
         payload = {
             "model": model_name,
             "prompt": formatted_prompt,
@@ -303,26 +604,25 @@ def generate_with_ollama(image_path_or_url, prompt, model_name="llama3.2-vision:
         # Send request to Ollama API
         # logging.info("Sending request to Ollama API...")
         start_time = time.time()
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=90)
-        elapsed_time = time.time() - start_time
-        logging.info(f"Response received from Ollama API in {elapsed_time:.2f} seconds.")
-
-        # Parse the response containing multiple JSON objects
-        raw_response = response.text
-        # logging.debug(f"Raw Alternative Text from Ollama API: {raw_response}")
-
-        # Split and parse each JSON object
-        final_text = ""
-        for line in raw_response.splitlines():
-            try:
-                json_object = json.loads(line)
-                if "response" in json_object:
-                    final_text += json_object["response"]
+        pieces = []
+        with send_request_with_retry(payload, stream=True) as response:
+            logging.info(f"Response received from Ollama API in {time.time() - start_time:.2f} seconds.")
+
+            # Ollama streams one JSON object per line; parse each as it arrives (orjson takes the
+            # raw bytes, so lines are not decoded to str first)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    json_object = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    logging.error(f"JSON decoding failed for line: {line}. Error: {e}")
+                    continue
+                pieces.append(json_object.get("response", ""))
                 if json_object.get("done", False):
                     break  # Stop if "done" is true
-            except json.JSONDecodeError as e:
-                logging.error(f"JSON decoding failed for line: {line}. Error: {e}")
-                continue
+        final_text = "".join(pieces)
+        logging.info(f"Ollama finished generating in {time.time() - start_time:.2f} seconds.")
 
         # Clean and format the final text
         final_text = final_text.strip('"\'").,: ')
@@ -342,8 +642,17 @@ def generate_with_ollama(image_path_or_url, prompt, model_name="llama3.2-vision:
         return f"Error generating alt text: {str(e)}"
 
 
+def azure_openai_messages(image_url):
+    """Build the Azure OpenAI chat prompt for an image given as a public URL or a data URL."""
+    return [
+        {"role": "system", "content": "Generate concise and descriptive alt text for an image."},
+        {"role": "user", "content": "Describe this image in detail. Keep the response less than 40 words."},
+        {"role": "user", "content": [{"type": "image_url", "image_url": {"url": image_url}}]}  # Correct format
+    ]
+
+
 # def generate_with_azure_openai(image_url, model, max_tokens, client):
-def generate_with_azure_openai(image_url, max_tokens=300):
+def generate_with_azure_openai(image_url, max_tokens=300, image_data=None):
     """Generate alt text using Azure OpenAI with a given image URL."""
     
     if client is None:
@@ -354,33 +663,37 @@ def generate_with_azure_openai(image_url, max_tokens=300):
         logging.info(f"🔵 Processing Image: {image_url}")
         print(f"🔵 Processing Image: {image_url}")
 
-        # ✅ Fetch & Encode Image
-        image_response = requests.get(image_url, stream=True)  # Renamed response
-        image_response.raise_for_status()
-        image_base64 = base64.b64encode(image_response.content).decode("utf-8")
-
-        # ✅ Determine MIME Type
-        mime_type = "image/jpeg"
-        if image_url.lower().endswith(".png"):
-            mime_type = "image/png"
-        elif image_url.lower().endswith(".webp"):
-            mime_type = "image/webp"
-
-        # ✅ Format Image for OpenAI API
-        image_data = f"data:{mime_type};base64,{image_base64}"
-
-        # ✅ Prepare Prompt
-        messages = [
-            {"role": "system", "content": "Generate concise and descriptive alt text for an image."},
-            {"role": "user", "content": "Describe this image in detail. Keep the response less than 40 words."},
-            {"role": "user", "content": [{"type": "image_url", "image_url": {"url": image_data}}]}  # Correct format
-        ]
-
-        response = client.chat.completions.create( # Use the client object directly
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=max_tokens,
-        )
+        # ✅ Let Azure fetch public images itself: no Base64 encoding and a far smaller request
+        response = None
+        if image_url.startswith("http"):
+            try:
+                API_RATE_LIMITER.wait()
+                response = client.chat.completions.create(
+                    model=DEPLOYMENT_NAME,
+                    messages=azure_openai_messages(image_url),
+                    max_tokens=max_tokens,
+                )
+            except BadRequestError as e:
+                logging.info("Azure OpenAI could not fetch %s itself, sending it inline: %s", image_url, e)
+
+        if response is None:
+            # ✅ Fetch & Encode Image
+            if image_data is None:
+                image_data = fetch_bytes(image_url)
+            image_data, mime_type = shrink_image_bytes(image_data, API_IMAGE_MAX_SIDE)
+            image_base64 = pybase64.b64encode(image_data).decode("ascii")
+
+            # ✅ Determine MIME Type from the bytes themselves (a downsized image is always JPEG)
+            if mime_type is None:
+                mime_type = sniff_mime_type(image_data)
+
+            # ✅ Format Image for OpenAI API (a second request for this image, so it is paced too)
+            API_RATE_LIMITER.wait()
+            response = client.chat.completions.create( # Use the client object directly
+                model=DEPLOYMENT_NAME,
+                messages=azure_openai_messages(f"data:{mime_type};base64,{image_base64}"),
+                max_tokens=max_tokens,
+            )
 
         # ✅ Extract Response
         if hasattr(response, "choices") and response.choices:
@@ -407,74 +720,182 @@ def generate_with_azure_openai(image_url, max_tokens=300):
         return f"Error: Something went wrong - {str(e)}"
     
 
-def check_image_exists(image_url):
+def fetch_image(image_url):
     """
-    Check if the image URL exists by making a HEAD request with redirects enabled.
-    If the URL contains query parameters, attempt checking the base URL without query strings.
+    Download an image in a single GET, following redirects.
+
+    The same transfer tells whether the image exists, what type it is and what its
+    bytes are, so nothing has to be requested twice. If the URL contains query
+    parameters and fails, the base URL without the query string is tried.
+
+    Returns:
+        tuple: (bytes, content type) if the image was downloaded, otherwise (None, None).
     """
     try:
-        # First attempt with full URL (including query params)
-        response = requests.head(image_url, timeout=10, allow_redirects=True)
+        response = SESSION.get(image_url, stream=True, timeout=IMAGE_TIMEOUT, allow_redirects=True)
 
         # If redirected, log the new URL
         if response.history:
-            logging.info(f"Redirected: {image_url} → {response.url}")
-
-        # If image is accessible, return True
-        if response.status_code == 200:
-            return True
+            logging.info("Redirected: %s → %s", image_url, response.url)
 
         # If the URL contains query parameters, try without them
         parsed_url = urlparse(image_url)
-        if parsed_url.query:
+        if response.status_code != 200 and parsed_url.query:
+            response.close()
             stripped_url = f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}"
-            logging.info(f"Retrying without query params: {stripped_url}")
-            response = requests.head(stripped_url, timeout=10, allow_redirects=True)
-            if response.status_code == 200:
-                return True
+            logging.info("Retrying without query params: %s", stripped_url)
+            response = SESSION.get(stripped_url, stream=True, timeout=IMAGE_TIMEOUT, allow_redirects=True)
 
-        logging.warning(f"Image not found or inaccessible: {image_url} (Status: {response.status_code})")
-        return False
+        if response.status_code != 200:
+            logging.warning("Image not found or inaccessible: %s (Status: %s)", image_url, response.status_code)
+            response.close()
+            return None, None
+
+        return response.content, response.headers.get("Content-Type", "")
 
     except requests.exceptions.RequestException as e:
-        logging.error(f"Error checking image existence for {image_url}: {e}")
-        return False
+        logging.error(f"Error fetching image {image_url}: {e}")
+        return None, None
     
 
-def extract_text_with_ocr(image_url):
+def to_grayscale(image):
+    """
+    Convert an image to 8-bit grayscale for OCR, flattening transparency onto white.
+
+    Args:
+        image (PIL.Image): The decoded image.
+
+    Returns:
+        PIL.Image: The image in mode "L" (returned as is if it already is).
+    """
+    if image.mode == "L":
+        return image
+    return flatten_transparency(image).convert("L")
+
+
+@functools.lru_cache(maxsize=1)
+def get_rapidocr():
+    """
+    Load the RapidOCR engine once per process, on first use.
+
+    Returns:
+        RapidOCR or None: The engine, or None if rapidocr_onnxruntime is not installed,
+        in which case Tesseract is used instead.
+    """
     try:
-        # Fetch the image
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
+        from rapidocr_onnxruntime import RapidOCR
+        logging.info("Using RapidOCR for text detection.")
+        return RapidOCR()
+    except Exception as e:
+        logging.warning(f"⚠️ Could not load RapidOCR, falling back to Tesseract: {e}")
+        return None
 
-        # Validate content type to ensure it's an image
-        content_type = response.headers.get("Content-Type", "")
-        if not content_type.startswith("image/"):
-            logging.error(f"URL does not point to a valid image: {image_url} (Content-Type: {content_type})")
-            return "Invalid image URL or unsupported type"
 
-        # Load the image using Pillow
-        image = Image.open(BytesIO(response.content))
+@functools.lru_cache(maxsize=1)
+def import_tesserocr():
+    """Import tesserocr once, returning None (and using the Tesseract CLI) if it is not installed."""
+    try:
+        import tesserocr
+        logging.info("Using tesserocr for text detection.")
+        return tesserocr
+    except Exception as e:
+        logging.warning(f"⚠️ Could not load tesserocr, falling back to the Tesseract CLI: {e}")
+        return None
+
+
+# One libtesseract API per worker thread: an API object must not be shared between threads,
+# but creating one per image would reload the language model every time
+_tesserocr_local = threading.local()
+
+
+def get_tesserocr_api():
+    """Return this thread's tesserocr API, created on first use, or None if tesserocr is unavailable."""
+    tesserocr = import_tesserocr()
+    if tesserocr is None:
+        return None
+    api = getattr(_tesserocr_local, "api", None)
+    if api is None:
+        # Same settings as OCR_TESSERACT_CONFIG: LSTM engine only, one uniform block of text
+        api = tesserocr.PyTessBaseAPI(oem=tesserocr.OEM.LSTM_ONLY, psm=tesserocr.PSM.SINGLE_BLOCK)
+        _tesserocr_local.api = api
+    return api
+
+
+def looks_like_text(image):
+    """
+    Guess cheaply whether an image could contain enough text to be worth OCR.
+
+    Args:
+        image (PIL.Image): The grayscale image OCR would read.
+
+    Returns:
+        bool: False when the image has too few sharp edges to hold 20 words.
+    """
+    gray = np.asarray(image, dtype=np.int16)
+    steps = np.abs(np.diff(gray, axis=1))
+    return np.count_nonzero(steps > OCR_GATE_STEP) >= OCR_GATE_MIN_EDGES
+
+
+def run_ocr(image):
+    """Extract text from a PIL image with the engine chosen by --ocr-engine, one line per text box."""
+    if args.ocr_engine == "rapidocr":
+        engine = get_rapidocr()
+        if engine is not None:
+            # RapidOCR works on OpenCV-style BGR arrays and runs in-process, without a subprocess
+            results, _ = engine(np.asarray(image.convert("RGB"))[:, :, ::-1])
+            return "\n".join(result[1] for result in results or [])
+    elif args.ocr_engine == "tesserocr":
+        api = get_tesserocr_api()
+        if api is not None:
+            # libtesseract reads the PIL image in memory: no subprocess and no temp file
+            api.SetImage(image)
+            return api.GetUTF8Text()
+    return pytesseract.image_to_string(image, config=OCR_TESSERACT_CONFIG)
+
+
+# Start of every result extract_text_with_ocr returns when it could not read the image
+OCR_FAILURE_PREFIXES = ("Unsupported image format", "Error loading image", "Unexpected error processing image")
+
 
-        # Validate image format
-        if image.format not in ["JPEG", "PNG", "BMP", "TIFF"]:
+def extract_text_with_ocr(image_data, image_url=""):
+    try:
+        # Load the already downloaded image using Pillow
+        image = Image.open(BytesIO(image_data))
+
+        # Validate image format; GIF and WebP are OCR'd on their first frame and, like the
+        # others, go on to the model when they hold no text
+        if image.format not in ["JPEG", "PNG", "BMP", "TIFF", "GIF", "WEBP"]:
             logging.error(f"Unsupported image format: {image.format} for URL: {image_url}")
             return f"Unsupported image format: {image.format}"
 
-        # Use Tesseract to extract text
-        ocr_text = pytesseract.image_to_string(image)
+        # Skip Tesseract outright on small decorative images
+        width, height = image.size
+        if width * height < OCR_MIN_PIXELS:
+            return ""
+
+        # Decode large JPEGs at a reduced scale, straight to grayscale (the chroma planes are
+        # never decoded), and cap the size Tesseract has to scan. Both the text gate and the OCR
+        # engines work on this single grayscale copy, which keeps the image's aspect ratio
+        image.draft("L", (OCR_IMAGE_MAX_SIDE, OCR_IMAGE_MAX_SIDE))
+        image = to_grayscale(image)
+        image.thumbnail((OCR_IMAGE_MAX_SIDE, OCR_IMAGE_MAX_SIDE), Image.BILINEAR)
+
+        # Most site images are photos; skip OCR unless the image has text-like edges
+        if not looks_like_text(image):
+            logging.debug("Skipping OCR, image does not look like text: %s", image_url)
+            return ""
+
+        # Use Tesseract (or RapidOCR) to extract text
+        ocr_text = run_ocr(image)
 
         # Count the number of words or lines to determine if the image is text-heavy
         word_count = len(ocr_text.split())
         if word_count > 20:  # Arbitrary threshold for text-heavy images
-            logging.info(f"Text-heavy image detected: {image_url}")
+            logging.info("Text-heavy image detected: %s", image_url)
             return ocr_text.strip()
         else:
             return ""
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Network error while fetching image: {e}")
-        return "Network error while fetching image"
     except OSError as e:
         logging.error(f"Error loading image with Pillow: {e}")
         return "Error loading image"
@@ -483,24 +904,55 @@ def extract_text_with_ocr(image_url):
         return "Unexpected error processing image"
 
 
-# Define a function to load the CSV file
+# Define a function to stream rows from the CSV file
 def load_csv(file_path):
+    """
+    Open a CSV file for streaming.
+
+    Returns:
+        tuple: (list of header field names, generator yielding the rows one at a time).
+    """
     try:
         # Increase the CSV field size limit
         csv.field_size_limit(sys.maxsize)
         
         logging.info(f"Loading CSV file from: {file_path}")
+        with open(file_path, mode="r", encoding="utf-8") as file:
+            fieldnames = csv.DictReader(file).fieldnames or []
+        return fieldnames, iter_csv_rows(file_path)
+    except Exception as e:
+        logging.error(f"Failed to load CSV file: {e}")
+        raise
+
+def iter_csv_rows(file_path):
+    """Yield the rows of a CSV file one at a time instead of loading the whole file."""
+    try:
         with open(file_path, mode="r", encoding="utf-8") as file:
             reader = csv.DictReader(file)
-            data = list(reader)
+            for row in reader:
+                yield row
         logging.info("CSV file loaded successfully.")
-        return data
     except Exception as e:
         logging.error(f"Failed to load CSV file: {e}")
         raise
 
+def count_csv_rows(file_path):
+    """Count the data rows of a CSV file (quoted newlines included) without keeping any of them."""
+    with open(file_path, mode="r", encoding="utf-8") as file:
+        return max(0, sum(1 for _ in csv.reader(file)) - 1)
+
 # Define a function to save the CSV file
-def save_csv(file_path, data, fieldnames):
+def save_csv(file_path, rows, fieldnames, flush_every=256):
+    """
+    Write rows to a timestamped copy of `file_path` as they are produced.
+
+    Args:
+        file_path (str): Base output path; the current date and time is appended.
+        rows (iterable): Processed row dicts.
+        fieldnames (list): Output header; keys not listed here are ignored.
+        flush_every (int): Flush the file after this many rows, so an interrupted run
+            keeps the rows it already finished.
+    """
     try:
         # Extract the base name and directory from the file path
         base_name, ext = os.path.splitext(file_path)
@@ -511,11 +963,14 @@ def save_csv(file_path, data, fieldnames):
         
         logging.info(f"Saving updated CSV file to: {updated_file_path}")
         
-        # Save the file with the updated name
+        # Save the file with the updated name, one row at a time
         with open(updated_file_path, mode="w", encoding="utf-8", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore")
             writer.writeheader()
-            writer.writerows(data)
+            for count, row in enumerate(rows, start=1):
+                writer.writerow(row)
+                if count % flush_every == 0:
+                    file.flush()
         
         logging.info("CSV file saved successfully.")
         print(f"✅ CSV file has been successfully saved to: {updated_file_path}")  # Add this print statement
@@ -523,140 +978,510 @@ def save_csv(file_path, data, fieldnames):
         logging.error(f"Failed to save CSV file: {e}")
         raise
 
+
+def iter_chunks(rows, size):
+    """Group an iterable of rows into lists of at most `size` rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def alt_text_cache_key(image_url, model):
+    """Build the cache key for an image URL and the model that described it."""
+    return hashlib.sha256(f"{model}\n{image_url}".encode("utf-8")).hexdigest()
+
+
+def content_cache_key(data, model):
+    """Build the cache key for the bytes of an image, shared by every URL serving the same file."""
+    return hashlib.sha256(data).hexdigest() + ":" + model
+
+
+def ocr_cache_key(data):
+    """Build the cache key for the OCR text of an image's bytes under the selected --ocr-engine."""
+    return hashlib.sha256(data).hexdigest() + ":ocr:" + args.ocr_engine
+
+
+# Results that say the image could not be fetched or read, rather than describe it
+UNCACHEABLE_PREFIXES = ("404", "Invalid image URL", "Unsupported image format")
+
+
+def is_cacheable_result(result):
+    """Only reuse real alt text and stable skips, never errors, missing or unreadable images."""
+    return (bool(result and result.strip()) and "error" not in result.lower()
+            and not result.startswith(UNCACHEABLE_PREFIXES))
+
+
+def load_alt_text_cache(file_path):
+    """Load previously generated alt text from a JSON Lines file of [key, result] pairs."""
+    if not os.path.exists(file_path):
+        return {}
+    cache = {}
+    try:
+        with open(file_path, mode="rb+") as file:
+            complete = 0  # Bytes up to the end of the last full line
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # A run killed mid-write left a truncated last line; drop it so the next
+                    # append starts on a fresh line
+                    file.truncate(complete)
+                    break
+                complete += len(line)
+                try:
+                    key, result = orjson.loads(line)
+                except (orjson.JSONDecodeError, ValueError):
+                    continue
+                cache[key] = result
+        logging.info(f"Loaded {len(cache)} cached alt text entries from: {file_path}")
+    except Exception as e:
+        logging.warning(f"Could not read alt text cache {file_path}, starting empty: {e}")
+    return cache
+
+
+def append_alt_text_cache(file_path, cache, start):
+    """
+    Append the entries added to the cache after its first `start` ones to the cache file.
+
+    Keys are added to the cache but never removed, so those entries are exactly the ones
+    not yet on disk. The file grows by one line per new result instead of being
+    rewritten on every checkpoint.
+    """
+    try:
+        with open(file_path, mode="ab") as file:
+            file.write(b"".join(orjson.dumps([key, result]) + b"\n"
+                                for key, result in itertools.islice(cache.items(), start, None)))
+        logging.info(f"Saved {len(cache) - start} new alt text cache entries to: {file_path}")
+    except Exception as e:
+        logging.error(f"Failed to save alt text cache {file_path}: {e}")
+
+
 def clean_ocr_text(ocr_text):
-    # Split into lines and remove duplicates or meaningless text
-    lines = ocr_text.split("\n")
-    cleaned_lines = []
-    for line in lines:
-        line = line.strip()
-        if line and line not in cleaned_lines:
-            cleaned_lines.append(line)
-    return " ".join(cleaned_lines)
+    # Split into lines and drop empty and repeated lines, keeping the first occurrence in order
+    lines = (line.strip() for line in ocr_text.split("\n"))
+    return " ".join(dict.fromkeys(line for line in lines if line))
+
+# Phrases that add nothing to alt text, removed in a single regex pass
+UNHELPFUL_PHRASES = [
+    "The image is", "This is an image of", "The alt text is",
+    "file with", "a jpg file", "a png file", "graphic of", "picture of",
+    "photo of", "image of"
+]
+# Longest phrases first, so a phrase is never cut short by a shorter one it contains
+_UNHELPFUL_RE = re.compile(
+    r"\b(?:" + "|".join(map(re.escape, sorted(UNHELPFUL_PHRASES, key=len, reverse=True))) + r")\b",
+    re.IGNORECASE,
+)
+# A word immediately repeated one or more times, in any case, e.g. "a a dog" or "A a dog"
+_DUPLICATE_WORD_RE = re.compile(r"\b(\w+)(?:\s+\1\b)+", re.IGNORECASE)
 
 def clean_and_post_process_alt_text(generated_text):
     """
     Cleans and post-processes generated alt text by removing unhelpful phrases, 
     duplicate words, and ensuring proper sentence case.
     """
-    # List of unhelpful phrases to remove
-    unhelpful_phrases = [
-        "The image is", "This is an image of", "The alt text is",
-        "file with", "a jpg file", "a png file", "graphic of", "picture of",
-        "photo of", "image of"
-    ]
-    for phrase in unhelpful_phrases:
-        generated_text = generated_text.replace(phrase, "").strip()
+    # Remove unhelpful phrases and collapse the gaps they leave behind
+    cleaned_text = " ".join(_UNHELPFUL_RE.sub("", generated_text).split())
 
-    # Remove duplicate words or phrases
-    words = generated_text.split()
-    cleaned_words = []
-    for i, word in enumerate(words):
-        if i == 0 or word != words[i - 1]:  # Skip consecutive duplicates
-            cleaned_words.append(word)
-    cleaned_text = " ".join(cleaned_words)
+    # Remove consecutive duplicate words
+    cleaned_text = _DUPLICATE_WORD_RE.sub(r"\1", cleaned_text)
 
     # Ensure sentence case: Capitalize the first letter and end with a period
     cleaned_text = cleaned_text.strip(". ").capitalize() + "."
 
-    # Truncate the text to 350 characters if necessary
+    # Truncate the text to 360 characters if necessary, on a word boundary with an ellipsis
+    # (text without a space in its first 357 characters is cut mid-word instead of dropped)
     if len(cleaned_text) > 360:
-        cleaned_text = cleaned_text[:357].rsplit(" ", 1)[0] + "..."  # Truncate and add ellipsis
+        cleaned_text = cleaned_text[:357].rsplit(" ", 1)[0] + "..."
 
     return cleaned_text
 
-# Generate alt text using BLIP with alt_text and title_text integration
-def generate_alt_text(image_url, alt_text="", title_text="", model="blip", client=None):
-    """Generate alt text using BLIP, Anthropic, Ollama, or Azure OpenAI."""
+def unprocessable_reason(image_url):
+    """
+    Cheaply decide, without any network access, whether an image URL can be processed.
 
-    while not check_internet():  # ✅ If no internet, pause execution
-        print("⏳ Internet connection lost. Pausing scan... Retrying in 60 seconds.")
-        time.sleep(60)
+    Returns:
+        str or None: The result to record for an unsupported URL, otherwise None.
+    """
+    if not image_url:
+        return "404 Image Not Found"
+    if not image_url.startswith(("http://", "https://")):
+        logging.info("Skipping unsupported image URL: %s", image_url)
+        return "Skipped: Unsupported image URL"
+    # Skip SVG files (not supported)
+    if urlparse(image_url).path.lower().endswith((".svg", ".svgz")):
+        logging.info("Skipping SVG file: %s", image_url)
+        return "Skipped: SVG file"
+    return None
+
+
+def screen_image(image_url, alt_cache=None):
+    """
+    Run the checks shared by every model before any alt text is generated.
 
+    OCR output (including "no text") is cached in `alt_cache` by image content, so the
+    same file is never run through OCR twice, in this run or a later one.
+
+    Returns:
+        tuple: (final result, None) with a skip notice, 404, OCR text or error if the
+        image should not be sent to a model, otherwise (None, downloaded image bytes).
+    """
     try:
         # Check if the image exists (Wrap in retry logic)
         while not check_internet():  
             print("⏳ Internet connection lost. Retrying in 60 seconds...")
             time.sleep(60)
 
-        # Skip SVG files (not supported)
-        if image_url.lower().endswith(".svg"):
-            logging.info(f"Skipping SVG file: {image_url}")
-            return "Skipped: SVG file"
+        # Download the image once; existence, type and bytes all come from this request
+        image_data, content_type = fetch_image(image_url)
+        if image_data is None:
+            logging.info("Image not found or inaccessible: %s", image_url)
+            return "404 Image Not Found", None
 
-        # Check if the image exists
-        if not check_image_exists(image_url):
-            logging.info(f"Image not found or inaccessible: {image_url}")
-            return "404 Image Not Found"
+        # Validate content type to ensure it's an image
+        if not content_type.startswith("image/"):
+            logging.error(f"URL does not point to a valid image: {image_url} (Content-Type: {content_type})")
+            return "Invalid image URL or unsupported type", None
 
         # Extract OCR text if the image is text-heavy
-        ocr_text = extract_text_with_ocr(image_url)
+        ocr_key = ocr_cache_key(image_data) if alt_cache is not None else None
+        if ocr_key in (alt_cache or {}):
+            ocr_text = alt_cache[ocr_key]
+        else:
+            ocr_text = extract_text_with_ocr(image_data, image_url)
+            # Cache only the OCR text itself ("" for no text), never a failure to read the image
+            if ocr_key and not ocr_text.startswith(OCR_FAILURE_PREFIXES):
+                alt_cache[ocr_key] = ocr_text
         if ocr_text:
-            logging.info(f"OCR used for text-heavy image: {image_url}")
-            return clean_ocr_text(ocr_text)
+            logging.info("OCR used for text-heavy image: %s", image_url)
+            return clean_ocr_text(ocr_text), None
+
+        return None, image_data
+
+    except Exception as e:
+        logging.error(f"Error generating alt text for {image_url}: {e}")
+        return f"Error generating alt text: {e}", None
+
+
+class RateLimiter:
+    """
+    Space out calls so that at most `per_minute` start in any minute, across threads.
 
+    Calls are spread evenly rather than allowed in bursts, so a provider's
+    per-minute quota is never exceeded at the start of a window.
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may send its request."""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = max(0.0, self.next_time - now)
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay:
+            time.sleep(delay)
+
+
+# Paces requests to the API-backed models (see --rpm and --api-workers)
+API_RATE_LIMITER = RateLimiter(args.rpm)
+
+
+# API model name -> callable(image_url, alt_text, title_text, image_data) returning alt text.
+# BLIP is not listed: process_rows captions it in batches (prepare_for_blip, flush_blip_batch)
+MODEL_BACKENDS = {
+    "anthropic": lambda url, alt, title, data: generate_with_anthropic(IMAGE_URL_PROMPT.format(image_url=url)),
+    "ollama": lambda url, alt, title, data: generate_with_ollama(
+        url, IMAGE_URL_PROMPT.format(image_url=url), image_data=data),
+    "azure_openai": lambda url, alt, title, data: generate_with_azure_openai(url, max_tokens=300, image_data=data),
+}
+
+
+# Models that are sent the image bytes, so identical files under different URLs get the same
+# alt text; Anthropic is only given the URL text
+CONTENT_KEYED_MODELS = {"ollama", "azure_openai"}
+# Content key -> Future of the model call describing those bytes, so identical images in flight
+# on different worker threads wait for one call instead of each sending their own. Calls that
+# fail are removed again, so a later copy of the image can retry
+_content_calls = {}
+_content_calls_lock = threading.Lock()
+
+
+def call_backend(image_url, alt_text, title_text, model, client, image_data):
+    """Run the selected model on one screened image, returning its alt text or an error message."""
+    try:
         # Generate alt text using the selected model
-        if model == "blip":
-            return generate_with_blip(image_url, alt_text, title_text)
-        elif model == "anthropic":
-            prompt = f"Generate concise and descriptive alt text for the following image URL: {image_url}."
-            return generate_with_anthropic(prompt)
-        elif model == "ollama":
-            prompt = f"Generate concise and descriptive alt text for the following image URL: {image_url}."
-            return generate_with_ollama(image_url, prompt)
-        elif model == "azure_openai":
-            # Ensure the client is provided for Azure OpenAI
-            if model == "azure_openai" and client is None:
-                raise ValueError("Azure OpenAI client is missing. Ensure it's properly initialized and passed.")
-            return generate_with_azure_openai(image_url, max_tokens=300)
-        else:
+        backend = MODEL_BACKENDS.get(model)
+        if backend is None:
             return f"Unsupported model: {model}"
+        # Ensure the client is provided for Azure OpenAI
+        if model == "azure_openai" and client is None:
+            raise ValueError("Azure OpenAI client is missing. Ensure it's properly initialized and passed.")
+        return backend(image_url, alt_text, title_text, image_data)
 
     except Exception as e:
         logging.error(f"Error generating alt text for {image_url}: {e}")
         return f"Error generating alt text: {e}"
-    
 
-# Main function
-if __name__ == "__main__":
-    # Parse command-line arguments
-    parser = argparse.ArgumentParser(description="Generate alt text for images based on a CSV file.")
-    parser.add_argument("-c", "--csv", required=True, help="Path to the input CSV file.")
-    parser.add_argument("-m", "--model", default=DEFAULT_MODEL, choices=["blip", "anthropic", "ollama", "azure_openai"], help="Model to use for text generation.")
-    args = parser.parse_args()
 
-    # Assign input arguments to variables
-    input_csv = args.csv
-    selected_model = args.model
+# Generate alt text for one image with an API model
+def generate_alt_text(image_url, alt_text="", title_text="", model="anthropic", client=None, alt_cache=None):
+    """
+    Generate alt text using Anthropic, Ollama, or Azure OpenAI.
 
-    # Validate Anthropic API key only if 'anthropic' model is selected
-    validate_anthropic_key(selected_model)
+    When a cache is given, the bytes downloaded while screening are hashed first, so the same
+    file served under a new URL reuses its cached alt text, or waits for the call already
+    describing it on another thread, instead of calling the model again.
 
-    # Load CSV data
-    data = load_csv(input_csv)
+    Returns:
+        tuple: (alt text or error message, content key or None).
+    """
 
-    # Process data and generate alt text
-    logging.info("Processing rows in the CSV file...")
-    for idx, row in enumerate(tqdm(data, desc="Processing images", unit="image")):
+    # screen_image waits for the internet connection before fetching anything
+    screened, image_data = screen_image(image_url, alt_cache)
+    if screened is not None:
+        return screened, None
+
+    if alt_cache is None or model not in CONTENT_KEYED_MODELS:
+        return call_backend(image_url, alt_text, title_text, model, client, image_data), None
+
+    content_key = content_cache_key(image_data, model)
+    if content_key in alt_cache:
+        logging.debug("Reusing cached alt text for identical image bytes: %s", image_url)
+        return alt_cache[content_key], content_key
+
+    with _content_calls_lock:
+        call = _content_calls.get(content_key)
+        is_first = call is None
+        if is_first:
+            call = _content_calls[content_key] = Future()
+    if not is_first:
+        logging.debug("Waiting for the alt text of identical image bytes: %s", image_url)
+        return call.result(), content_key
+
+    try:
+        result = call_backend(image_url, alt_text, title_text, model, client, image_data)
+    except BaseException as e:
+        # Never leave the threads waiting on this call blocked, e.g. on KeyboardInterrupt
+        with _content_calls_lock:
+            del _content_calls[content_key]
+        call.set_exception(e)
+        raise
+    if not is_cacheable_result(result):
+        with _content_calls_lock:
+            del _content_calls[content_key]
+    call.set_result(result)
+    return result, content_key
+
+
+def prepare_for_blip(image_url, model, alt_cache):
+    """
+    Screen an image and load it for BLIP. Safe to run from worker threads.
+
+    The bytes downloaded while screening are hashed first, so the same file served under a new
+    URL reuses its cached caption instead of being decoded and captioned again.
+
+    Returns:
+        tuple: (PIL.Image, None, content key) if the image should be captioned,
+        otherwise (None, final result string, content key or None).
+    """
+    screened, data = screen_image(image_url, alt_cache)
+    if screened is not None:
+        return None, screened, None
+
+    content_key = content_cache_key(data, model)
+    if content_key in alt_cache:
+        logging.debug("Reusing cached alt text for identical image bytes: %s", image_url)
+        return None, alt_cache[content_key], content_key
+    image, error = decode_blip_image(data)
+    return image, error, content_key
+
+
+def prefetch(func, items, executor, max_workers):
+    """
+    Apply `func` to each item on a thread pool and yield the results in input order.
+
+    At most 2 * max_workers calls are in flight, so downloads run ahead of the
+    caller (e.g. while BLIP captions the previous batch) without holding every
+    image in memory. The executor is owned by the caller and outlives the call, so
+    its threads (and their per-thread OCR engines) are reused from chunk to chunk.
+    """
+    max_workers = max(1, max_workers)
+    futures = deque()
+    for item in items:
+        futures.append(executor.submit(func, item))
+        if len(futures) >= max_workers * 2:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def store_result(rows, key, result, alt_cache, content_key=None):
+    """Write a result to every row sharing the image and cache it when it can be reused."""
+    for row in rows:
+        row["Generated Alt Text"] = result
+    if is_cacheable_result(result):
+        alt_cache[key] = result
+        if content_key:
+            alt_cache[content_key] = result
+
+
+def flush_blip_batch(pending, alt_cache):
+    """Caption the queued (cache key, content key, rows, image) entries in one BLIP batch and empty the queue."""
+    # Identical bytes queued under different URLs are captioned once and the caption shared
+    groups = {}  # Content key -> (image, [(cache key, rows), ...])
+    for key, content_key, rows, image in pending:
+        groups.setdefault(content_key, (image, []))[1].append((key, rows))
+    captions = generate_with_blip_batch([image for image, _ in groups.values()])
+    for (content_key, (_, entries)), caption in zip(groups.items(), captions):
+        for key, rows in entries:
+            store_result(rows, key, caption, alt_cache, content_key)
+    pending.clear()
+    
+
+def warm_up_blip():
+    """Run one throwaway batch so torch.compile finishes compiling before real images arrive."""
+    blank = Image.new("RGB", (BLIP_IMAGE_SIZE, BLIP_IMAGE_SIZE))
+    start_time = time.time()
+    generate_with_blip_batch([blank] * max(1, args.batch_size))
+    logging.info(f"BLIP warm-up finished in {time.time() - start_time:.2f} seconds.")
+
+
+def process_rows(rows, start, selected_model, alt_cache, run_results, executor):
+    """
+    Fill in "Generated Alt Text" for a chunk of CSV rows.
+
+    Args:
+        rows (list): Row dicts from the input CSV, updated in place.
+        start (int): Index of the first row in the file, used in log messages.
+        selected_model (str): Model used for text generation.
+        alt_cache (dict): Persistent alt text cache, updated with new results.
+        run_results (dict): Image URL -> result generated earlier in this run.
+        executor (ThreadPoolExecutor): Worker threads shared by every chunk of the run.
+    """
+    queued_rows = {}  # Image URL -> rows waiting for the same generated alt text
+    for idx, row in enumerate(rows, start=start):
         image_url = row.get("Image_url", "")
 
         if not image_url:
-            logging.warning(f"Row {idx + 1} is missing an Image URL. Skipping.")
+            logging.warning("Row %d is missing an Image URL. Skipping.", idx + 1)
             # row["Generated Alt Text"] = "Error: Missing image URL"
-            row["Generated Alt Text"] = generate_alt_text(image_url, model=selected_model, client=client)
+            row["Generated Alt Text"] = unprocessable_reason(image_url)
             continue
 
         # Check if the suggestions indicate alt text needs improvement
         suggestions = row.get("Suggestions", "")
-        if any(problematic in suggestions for problematic in PROBLEMATIC_SUGGESTIONS):
-            logging.info(f"\nGenerating alt text for row {idx + 1} due to suggestion: {suggestions}. \n\n\n")
-            # row["Generated Alt Text"] = generate_alt_text(image_url, model=selected_model)
-            row["Generated Alt Text"] = generate_alt_text(image_url, model=selected_model, client=client)
+        if _PROBLEMATIC_RE.search(suggestions):
+            logging.debug("Generating alt text for row %d due to suggestion: %s", idx + 1, suggestions)
+
+            # Unsupported URLs never reach the network, the download pool or a model
+            skip_reason = unprocessable_reason(image_url)
+            if skip_reason:
+                row["Generated Alt Text"] = skip_reason
+                continue
+
+            # Reuse alt text for images already described in this or a previous run
+            key = alt_text_cache_key(image_url, selected_model)
+            if key in alt_cache:
+                row["Generated Alt Text"] = alt_cache[key]
+                continue
+            if image_url in run_results:
+                row["Generated Alt Text"] = run_results[image_url]
+                continue
+
+            queued_rows.setdefault(image_url, []).append(row)
         else:
-            logging.info(f"Alt text for row {idx + 1} seems fine. Skipping generation for {image_url}.")
+            logging.debug("Alt text for row %d seems fine. Skipping generation for %s.", idx + 1, image_url)
             row["Generated Alt Text"] = "Skipped: Alt text sufficient \n\n\n"
 
-    # Save updated CSV
+    if selected_model != "blip":
+        # API models are called per image; run several requests at once, each on its own thread
+        image_urls = list(queued_rows)
+        generate = functools.partial(generate_alt_text, model=selected_model, client=client, alt_cache=alt_cache)
+        results = prefetch(generate, image_urls, executor, args.api_workers)
+        for image_url, (result, content_key) in zip(image_urls, results):
+            run_results[image_url] = result
+            store_result(queued_rows[image_url], alt_text_cache_key(image_url, selected_model), result, alt_cache,
+                         content_key)
+        return
+
+    # Download and screen each distinct BLIP image on worker threads while batches are captioned
+    pending_blip = []  # (cache key, content key, rows, image) entries waiting for the next BLIP batch
+    blip_urls = list(queued_rows)
+    prepare = functools.partial(prepare_for_blip, model=selected_model, alt_cache=alt_cache)
+    for image_url, (image, result, content_key) in zip(blip_urls, prefetch(prepare, blip_urls, executor, args.workers)):
+        key = alt_text_cache_key(image_url, selected_model)
+        if image is None:
+            run_results[image_url] = result
+            store_result(queued_rows[image_url], key, result, alt_cache, content_key)
+            continue
+        # A copy of this image was captioned in an earlier batch while this one was being prepared
+        if content_key in alt_cache:
+            store_result(queued_rows[image_url], key, alt_cache[content_key], alt_cache, content_key)
+            continue
+
+        pending_blip.append((key, content_key, queued_rows[image_url], image))
+        if len(pending_blip) >= max(1, args.batch_size):
+            flush_blip_batch(pending_blip, alt_cache)
+
+    # Caption whatever is left in the last partial batch
+    flush_blip_batch(pending_blip, alt_cache)
+
+
+def generate_rows(rows, selected_model, alt_cache, total=None):
+    """Process rows chunk by chunk, yielding each row once its alt text is ready."""
+    run_results = {}  # Image URL -> result generated during this run (including errors)
+    progress = tqdm(total=total, desc="Processing rows", unit="row")
+    start = 0
+    saved_entries = len(alt_cache)
+    # One pool for the whole run (--api-workers request threads for API models, --workers download
+    # threads for BLIP), so threads and their tesserocr engines are not recreated for every chunk
+    max_workers = max(1, args.api_workers if selected_model != "blip" else args.workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in iter_chunks(rows, max(1, args.chunk_size)):
+            process_rows(chunk, start, selected_model, alt_cache, run_results, executor)
+            start += len(chunk)
+            progress.update(len(chunk))
+            # Checkpoint new results after every chunk, so an interrupted run resumes where it stopped
+            if not args.no_cache and len(alt_cache) != saved_entries:
+                append_alt_text_cache(args.cache_file, alt_cache, saved_entries)
+                saved_entries = len(alt_cache)
+            yield from chunk
+    progress.close()
+
+
+# Main function
+if __name__ == "__main__":
+    # Assign input arguments to variables
+    input_csv = args.csv
+    selected_model = args.model
+
+    # Validate Anthropic API key only if 'anthropic' model is selected
+    validate_anthropic_key(selected_model)
+
+    if selected_model == "blip":
+        # Load BLIP up front so a bad install fails before any rows are processed
+        get_blip()
+        if args.compile:
+            warm_up_blip()
+
+    # Load any alt text generated by earlier runs
+    alt_cache = {} if args.no_cache else load_alt_text_cache(args.cache_file)
+
+    # Stream the CSV: read a chunk, generate alt text, write it out, move on
+    logging.info("Processing rows in the CSV file...")
     output_csv = input_csv.replace(".csv", "_with_alt_text.csv")
-    fieldnames = data[0].keys() if data else []
-    save_csv(output_csv, data, fieldnames)
+    input_fieldnames, rows = load_csv(input_csv)
+    fieldnames = input_fieldnames + [name for name in OUTPUT_FIELDNAMES if name not in input_fieldnames]
+    # A quick extra pass over the file gives the progress bar its total and ETA
+    total_rows = count_csv_rows(input_csv)
+    save_csv(output_csv, generate_rows(rows, selected_model, alt_cache, total_rows), fieldnames,
+             flush_every=max(1, args.chunk_size))
     logging.info(f"Processed CSV saved to: {output_csv}")